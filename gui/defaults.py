@@ -3,10 +3,6 @@ import __main__
 
 from gui import USER_DATA_DIR
 
-try:
-    from cefpython3 import cefpython as cef
-except Exception:
-    cef = None
 import pygameextra as pe
 
 
@@ -47,6 +43,7 @@ class Defaults:
     CONFIG_FILE_PATH = pe.settings.config_file_path  # The GUI handles the path for this
     SYNC_FILE_PATH = os.path.join(SCRIPT_DIR, 'sync')
     THUMB_FILE_PATH = os.path.join(SCRIPT_DIR, 'thumbnails')
+    CACHE_DIR = os.path.join(SCRIPT_DIR, 'cache')
     LOG_FILE = os.path.join(SCRIPT_DIR, 'moss.log')
 
     CUSTOM_FONT = os.path.join(FONT_DIR, 'Imperator.ttf')
@@ -2,41 +2,40 @@ import atexit
 import json
 import os
 import time
+import zlib
+from functools import lru_cache
 from numbers import Number
 from os import makedirs
 from typing import TypedDict, Union, TYPE_CHECKING
 
 import appdirs
+import numpy as np
 import pygameextra as pe
 from queue import Queue
 from box import Box
-from colorama import Fore
 
-from rm_api.auth import FailedToRefreshToken
-from rm_api.notifications.models import APIFatal
 from .events import ResizeEvent
 from .literals import PDF_RENDER_MODES, NOTEBOOK_RENDER_MODES, MAIN_MENU_MODES, MAIN_MENU_LOCATIONS
 
 Defaults = None
 
-try:
-    from CEF4pygame import CEFpygame
-except Exception:
-    CEFpygame = None
+# CEF is a very heavy import, it is only loaded once something asks for it, see get_cefpygame
+CEFpygame = None
 try:
     import pymupdf
 except Exception:
     pymupdf = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-from rm_api import API
 from .aspect_ratio import Ratios
 
 if TYPE_CHECKING:
     from gui.screens.main_menu import MainMenu
     from .screens.import_screen import ImportScreen
 
-pe.init()
-
 AUTHOR = "RedTTG"
 APP_NAME = "Moss"
 INSTALL_DIR = appdirs.site_data_dir(APP_NAME, AUTHOR)
@@ -96,10 +95,33 @@ DEFAULT_CONFIG: ConfigDict = {
 ConfigType = Box[ConfigDict]
 
 
-def load_config() -> ConfigType:
-    config = DEFAULT_CONFIG
-    changes = False
+def config_loads(data: bytes) -> dict:
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def config_dumps(config: dict) -> bytes:
+    if orjson:
+        return orjson.dumps(config, option=orjson.OPT_INDENT_2)
+    return json.dumps(config, indent=4).encode()
+
 
+def get_cefpygame():
+    global CEFpygame
+    if CEFpygame is None:
+        try:
+            import CEF4pygame
+            CEF4pygame.print = lambda *args, **kwargs: None
+            from CEF4pygame import CEFpygame
+        except Exception:
+            CEFpygame = False
+    return CEFpygame or None
+
+
+@lru_cache(maxsize=1)
+def get_config_file_path() -> str:
+    # The install marker doesn't change while running, so it is only checked once
     try:
         # noinspection PyUnresolvedReferences
         i_am_an_install = os.path.exists(os.path.join(__compiled__.containing_dir, 'installed'))
@@ -107,13 +129,20 @@ def load_config() -> ConfigType:
         i_am_an_install = os.path.exists(os.path.join(os.path.dirname(__file__), 'installed'))
 
     if i_am_an_install:
-        file = os.path.join(USER_DATA_DIR, 'config.json')
-    else:
-        try:
-            # noinspection PyUnresolvedReferences
-            file = os.path.join(__compiled__.containing_dir, 'config.json')
-        except NameError:
-            file = 'config.json'
+        return os.path.join(USER_DATA_DIR, 'config.json')
+    try:
+        # noinspection PyUnresolvedReferences
+        return os.path.join(__compiled__.containing_dir, 'config.json')
+    except NameError:
+        return 'config.json'
+
+
+def load_config() -> ConfigType:
+    from colorama import Fore
+    config = dict(DEFAULT_CONFIG)
+    changes = False
+
+    file = get_config_file_path()
 
     setattr(pe.settings, 'config_file_path', file)
 
@@ -123,24 +152,24 @@ def load_config() -> ConfigType:
 
     if os.path.exists(file):
         exists = True
-        with open(file) as f:
-            current_json = json.load(f)
+        with open(file, 'rb') as f:
+            current_json = config_loads(f.read())
             # Check if there are any new keys
-            changes = len(config.keys() - current_json.keys()) != 0
-            config = {**config, **current_json}
+            changes = any(key not in current_json for key in config)
+            config.update(current_json)
     else:
         changes = True
         exists = False
     if changes:
-        with open(file, "w") as f:
-            json.dump(config, f, indent=4)
+        with open(file, "wb") as f:
+            f.write(config_dumps(config))
         if not exists:
             print("Config file created. You can edit it manually if you want.")
     if config['pdf_render_mode'] not in PDF_RENDER_MODES.__args__:
         raise ValueError(f"Invalid pdf_render_mode: {config['pdf_render_mode']}")
     if config['pdf_render_mode'] == 'retry':
         config['pdf_render_mode'] = 'cef'
-    if config['pdf_render_mode'] == 'cef' and CEFpygame is None:
+    if config['pdf_render_mode'] == 'cef' and get_cefpygame() is None:
         print(f"{Fore.YELLOW}Cef is not installed or is not compatible with your python version.{Fore.RESET}")
         config['pdf_render_mode'] = 'pymupdf'
     if config['pdf_render_mode'] == 'pymupdf' and not pymupdf:
@@ -160,7 +189,12 @@ class GUI(pe.GameContext):
 
     def __init__(self):
         global Defaults
+        pe.init()
         self.config = load_config()
+        # Flags checked every frame, read once instead of going through Box each time
+        self.enable_fake_screen_refresh = self.config.enable_fake_screen_refresh
+        self.debug = self.config.debug
+        self.debug_button_rects = self.config.debug_button_rects
 
         self.AREA = (self.WIDTH * self.config.scale, self.HEIGHT * self.config.scale)
         self.dirty_config = False
@@ -174,11 +208,14 @@ class GUI(pe.GameContext):
         self.BACKGROUND = Defaults.BACKGROUND
         super().__init__()
 
+        from rm_api import API
+        from rm_api.auth import FailedToRefreshToken
         try:
             self.api = API(**self.api_kwargs)
         except FailedToRefreshToken:
             os.remove(Defaults.TOKEN_FILE_PATH)
             self.api = API(**self.api_kwargs)
+        atexit.register(self.api.close)
         self.api.last_root = self.config.last_root
         self.api.debug = self.config.debug
         self.screens = Queue()
@@ -206,10 +243,13 @@ class GUI(pe.GameContext):
         self.fake_screen_refresh_timer: float = None
         self.original_screen_refresh_surface: pe.Surface = None
         self.fake_screen_refresh_surface: pe.Surface = None
+        self.fake_screen_refresh_cache: Union[tuple, None] = None
+        self.fake_screen_refresh_blur_surface: Union[pe.pygame.Surface, None] = None
         self.last_screen_count = 1
         self.api.add_hook('GUI', self.handle_api_event)
         pe.display.set_icon(Defaults.APP_ICON)
         makedirs(Defaults.THUMB_FILE_PATH, exist_ok=True)
+        makedirs(Defaults.CACHE_DIR, exist_ok=True)
 
     @property
     def api_kwargs(self):
@@ -223,7 +263,7 @@ class GUI(pe.GameContext):
         }
 
     def pre_loop(self):
-        if self.config.enable_fake_screen_refresh and (len(
+        if self.enable_fake_screen_refresh and (len(
                 self.screens.queue) != self.last_screen_count or not self.reset_fake_screen_refresh):
             self.doing_fake_screen_refresh = True
             if self.reset_fake_screen_refresh:
@@ -231,27 +271,57 @@ class GUI(pe.GameContext):
             else:
                 self.reset_fake_screen_refresh = True
             self.last_screen_count = len(self.screens.queue)
-            smaller_size = tuple(v * .8 for v in self.size)
 
-            self.original_screen_refresh_surface = pe.Surface(self.size)
-            self.fake_screen_refresh_surface = pe.Surface(self.size,
-                                                          surface=pe.pygame.Surface(self.size, flags=0))  # Non alpha
+            # Reuse the last refresh surfaces if the screen hasn't changed since
+            refresh_key = self.fake_screen_refresh_key()
+            if self.fake_screen_refresh_cache and self.fake_screen_refresh_cache[0] == refresh_key:
+                _, self.original_screen_refresh_surface, self.fake_screen_refresh_surface = \
+                    self.fake_screen_refresh_cache
+            else:
+                self.make_fake_screen_refresh_surfaces()
+                self.fake_screen_refresh_cache = (
+                    refresh_key, self.original_screen_refresh_surface, self.fake_screen_refresh_surface
+                )
 
-            self.original_screen_refresh_surface.stamp(self.surface)
-            self.fake_screen_refresh_surface.stamp(self.surface.surface)
+        super().pre_loop()
 
-            # BLUR
-            self.original_screen_refresh_surface.resize(smaller_size)
-            self.original_screen_refresh_surface.resize(self.size)
-            self.fake_screen_refresh_surface.resize(smaller_size)
-            self.fake_screen_refresh_surface.resize(self.size)
+    def fake_screen_refresh_key(self):
+        # A checksum of the whole frame, far cheaper than the blur it lets us skip
+        return self.size, zlib.crc32(pe.pygame.image.tobytes(self.surface.surface, 'RGBA'))
 
-            # Invert colors
-            pixels = pe.pygame.surfarray.pixels2d(self.fake_screen_refresh_surface.surface)
-            pixels ^= 2 ** 32 - 1
-            del pixels
+    def make_fake_screen_refresh_surfaces(self):
+        smaller_size = tuple(int(v * .8) for v in self.size)
 
-        super().pre_loop()
+        # Reuse the previous surfaces if the window size hasn't changed
+        if self.fake_screen_refresh_cache and self.fake_screen_refresh_cache[1].size == self.size:
+            _, self.original_screen_refresh_surface, self.fake_screen_refresh_surface = self.fake_screen_refresh_cache
+            self.original_screen_refresh_surface.surface.fill(Defaults.TRANSPARENT_COLOR)
+        else:
+            self.original_screen_refresh_surface = pe.Surface(self.size)
+            self.fake_screen_refresh_surface = pe.Surface(self.size,
+                                                          surface=pe.pygame.Surface(self.size, flags=0))  # Non alpha
+        if self.fake_screen_refresh_blur_surface is None or \
+                self.fake_screen_refresh_blur_surface.get_size() != smaller_size:
+            self.fake_screen_refresh_blur_surface = pe.pygame.Surface(smaller_size, flags=pe.pygame.SRCALPHA)
+
+        self.original_screen_refresh_surface.stamp(self.surface)
+
+        # BLUR, once, both refresh surfaces share the blurred screen
+        pe.pygame.transform.smoothscale(self.original_screen_refresh_surface.surface, smaller_size,
+                                        self.fake_screen_refresh_blur_surface)
+        pe.pygame.transform.smoothscale(self.fake_screen_refresh_blur_surface, self.size,
+                                        self.original_screen_refresh_surface.surface)
+        self.fake_screen_refresh_surface.stamp(self.original_screen_refresh_surface)
+
+        # Invert colors
+        if self.fake_screen_refresh_surface.surface.get_bytesize() in (3, 4):
+            pixels = pe.pygame.surfarray.pixels3d(self.fake_screen_refresh_surface.surface)
+            np.bitwise_not(pixels, out=pixels)
+        else:
+            # Packed formats don't have a per channel view
+            pixels = pe.pygame.surfarray.pixels2d(self.fake_screen_refresh_surface.surface)
+            pixels ^= (1 << self.fake_screen_refresh_surface.surface.get_bitsize()) - 1
+        del pixels
 
     def quick_refresh(self):
         self.reset_fake_screen_refresh = False
@@ -263,8 +333,8 @@ class GUI(pe.GameContext):
         self.screens.queue[-1]()
 
     def save_config(self):
-        with open("config.json", "w") as f:
-            json.dump(self.config, f, indent=4)
+        with open("config.json", "wb") as f:
+            f.write(config_dumps(self.config))
 
     def save_config_if_dirty(self):
         if not self.dirty_config:
@@ -302,7 +372,7 @@ class GUI(pe.GameContext):
             self.fake_screen_refresh()
 
     def end_loop(self):
-        if self.config.debug_button_rects:
+        if self.debug_button_rects:
             for button in self.buttons:
                 rect = pe.Rect(*button.area)
                 if button.display_reference.pos:
@@ -332,7 +402,7 @@ class GUI(pe.GameContext):
             self.api.spread_event(ResizeEvent(pe.display.get_size()))
         if self.screens.queue[-1].handle_event != self.handle_event:
             self.screens.queue[-1].handle_event(e)
-        if self.config.debug and pe.event.key_DOWN(pe.K_s):
+        if self.debug and pe.event.key_DOWN(pe.K_s):
             self.screenshot = True
         self.extra_event(e)
         super().handle_event(e)
@@ -341,6 +411,7 @@ class GUI(pe.GameContext):
         self.running = False
 
     def handle_api_event(self, e):
+        from rm_api.notifications.models import APIFatal
         if isinstance(e, APIFatal):
             self.running = False
             self.api.log("A FATAL API ERROR OCCURRED, CRASHING!")
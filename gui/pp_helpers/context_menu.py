@@ -29,18 +29,20 @@ class ContextMenu(ContextBar, ABC):
         self.quick_refresh()
 
     def post_loop(self):
+        any_clicked = any(pe.mouse.clicked())
         if self.waiting_for_let_go:
-            if not any(pe.mouse.clicked()):
+            if not any_clicked:
                 self.waiting_for_let_go = False
-        elif any(pe.mouse.clicked()) and not self.rect.collidepoint(pe.mouse.pos()):
+        elif any_clicked and not self.rect.collidepoint(pe.mouse.pos()):
             self.close()
 
     def finalize_button_rect(self, buttons, width, height):
-        max_width = max(button.area.width for button in buttons)
+        areas = [button.area for button in buttons]
+        max_width = max(area.width for area in areas)
         x = self.left
         y = self.top
-        for button in buttons:
-            button.area.topleft = x, y
-            button.area.width = max_width
-            y += button.area.height
-        self.rect = pe.Rect(self.left, self.top, max_width, y - self.top)
+        for area in areas:
+            area.topleft = x, y
+            area.width = max_width
+            y += area.height
+        self.rect = pe.Rect(x, self.top, max_width, y - self.top)
@@ -16,10 +16,16 @@ if TYPE_CHECKING:
     from queue import Queue
 
 
+@lru_cache(maxsize=1024)
+def get_item_keys(uuid: str) -> Tuple[str, str, str]:
+    # The title hover, full title and debug keys, built once per document / collection instead of every frame
+    return uuid + '_title_hover', uuid + '_full', uuid + '_debug'
+
+
 def render_full_collection_title(gui: 'GUI', texts, collection_uuid: str, rect):
     pe.draw.rect(Defaults.OUTLINE_COLOR, rect, gui.ratios.outline)
     text = texts[collection_uuid]
-    text_full = texts[collection_uuid + '_full']
+    text_full = texts[get_item_keys(collection_uuid)[1]]
     if text.text != text_full.text:
         FullTextPopup.create(gui, text_full, text)()
 
@@ -72,7 +78,7 @@ def render_collection(gui: 'GUI', collection: 'DocumentCollection', texts: Dict[
     render_button_using_text(
         gui, text,
         Defaults.TRANSPARENT_COLOR, Defaults.TRANSPARENT_COLOR,
-        name=collection.uuid + '_title_hover',
+        name=get_item_keys(collection.uuid)[0],
         action=None,
         data=None,
         action_set={
@@ -102,7 +108,7 @@ def render_collection(gui: 'GUI', collection: 'DocumentCollection', texts: Dict[
 
 def render_full_document_title(gui: 'GUI', texts, document_uuid: str):
     text = texts[document_uuid]
-    text_full = texts[document_uuid + '_full']
+    text_full = texts[get_item_keys(document_uuid)[1]]
     if text.text != text_full.text:
         FullTextPopup.create(gui, text_full, text)()
 
@@ -128,6 +134,7 @@ def render_document(gui: 'GUI', rect: pe.Rect, texts, document: 'Document',
                     selected: bool = False):
     # Check if the document is being debugged and keep the debug menu open
 
+    title_hover_key, _, debug_key = get_item_keys(document.uuid)
     inverse_key = '_inverted' if selected else ''
     title_text = texts.get(document.uuid + inverse_key)
     if not title_text:
@@ -178,7 +185,7 @@ def render_document(gui: 'GUI', rect: pe.Rect, texts, document: 'Document',
     render_button_using_text(
         gui, title_text,
         Defaults.TRANSPARENT_COLOR, Defaults.TRANSPARENT_COLOR,
-        name=document.uuid + '_title_hover',
+        name=title_hover_key,
         action=None,
         data=None,
         action_set={
@@ -242,7 +249,7 @@ def render_document(gui: 'GUI', rect: pe.Rect, texts, document: 'Document',
         disabled=document.provision or disabled
     )
 
-    if gui.config.debug:
+    if gui.debug:
         popup_exists = DocumentDebugPopup.EXISTING.get(id(document)) is not None
         debug_text = gui.main_menu.texts['debug']
 
@@ -261,7 +268,7 @@ def render_document(gui: 'GUI', rect: pe.Rect, texts, document: 'Document',
             pe.button.action(
                 inflated_rect,
                 hover_draw_action=draw_debug_background,
-                name=document.uuid + '_debug',
+                name=debug_key,
                 action=open_document_debug_menu,
                 data=(gui, document, inflated_rect.topleft)
             )
@@ -325,39 +332,37 @@ def render_header(gui: 'GUI', texts: Dict[str, pe.Text], callback, path_queue: '
     x = texts[menu_location].rect.right + gui.ratios.main_menu_path_padding
     y = texts[menu_location].rect.centery
 
-    width = 0
-    skips = 0
+    chevron_right = gui.icons['chevron_right']
+    items = list(path_queue.queue)
+    path_texts = [texts[f'path_{item}'] for item in items]
 
     # Calculate the width of the path
-    for item in path_queue.queue:
-        text_key = f'path_{item}'
-        width += gui.icons['chevron_right'].width + texts[text_key].rect.width
+    width = sum(chevron_right.width + text.rect.width for text in path_texts)
+    skips = 0
 
     # Calculate the number of items to skip in the path, this results in the > > you see in the beginning
     while width > gui.width - (x + 200):
         skips += 1
-        if len(path_queue.queue) - skips <= 0:
+        if len(items) - skips <= 0:
             # window is too small to render the path
             return
-        width -= texts[f'path_{path_queue.queue[-skips]}'].rect.width
+        width -= path_texts[-skips].rect.width
 
     # Draw the path
-    for i, item in enumerate(reversed(path_queue.queue)):
-        text_key = f'path_{item}'
-
+    for i, (item, text) in enumerate(zip(reversed(items), reversed(path_texts))):
         # Draw the arrow
         if i >= skips or i < 1:  # Making sure to render the arrow only for the first skip, making sure to avoid > > > >
-            gui.icons['chevron_right'].display((x, y - gui.icons['chevron_right'].height // 2))
+            chevron_right.display((x, y - chevron_right.height // 2))
 
-            x += gui.icons['chevron_right'].width
+            x += chevron_right.width
             if i == 0:
                 x += gui.ratios.main_menu_path_first_padding
 
         # Draw the text only if it's not skipped
         if i >= skips:
-            texts[text_key].rect.midleft = (x, y)
-            render_button_using_text(gui, texts[text_key], action=callback, data=item, name=f'main_menu.path={item}')
-            x += texts[text_key].rect.width
+            text.rect.midleft = (x, y)
+            render_button_using_text(gui, text, action=callback, data=item, name=f'main_menu.path={item}')
+            x += text.rect.width
 
 
 @lru_cache
@@ -3,6 +3,8 @@ import shutil
 import subprocess
 import sys
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 import pygameextra as pe
 from typing import TYPE_CHECKING, Dict
@@ -11,6 +13,7 @@ from gui.events import ResizeEvent
 from gui.screens.mixins import LogoMixin
 
 if os.name == 'nt':
+    import pythoncom
     import winshell
 
 from gui import APP_NAME, INSTALL_DIR, USER_DATA_DIR
@@ -21,6 +24,17 @@ if TYPE_CHECKING:
     from rm_api import API
 
 
+# The shell folders don't move while installing, so they are only looked up once
+@lru_cache()
+def get_desktop_path():
+    return winshell.desktop()
+
+
+@lru_cache()
+def get_start_menu_path():
+    return winshell.start_menu()
+
+
 class Installer(pe.ChildContext, LogoMixin):
     LAYER = pe.AFTER_LOOP_LAYER
     icons: Dict[str, pe.Image]
@@ -56,7 +70,9 @@ class Installer(pe.ChildContext, LogoMixin):
         self.calculate_texts()
         self.api.add_hook(self.EVENT_HOOK_NAME, self.resize_check_hook)
         self.total = 0
+        self.inverse_total = 0
         self.progress = 0
+        self.walk_cache = None
         self.just_installed = False
 
     def resize_check_hook(self, event):
@@ -77,12 +93,10 @@ class Installer(pe.ChildContext, LogoMixin):
         pe.draw.rect(Defaults.LINE_GRAY, rect, self.ratios.pixel(3))
 
     def loop(self):
-        self.logo.display()
+        self.display_logo(line=self.installing)
         if self.installing:
-            pe.draw.rect(pe.colors.black, self.line_rect, 1)
-            progress_rect = self.line_rect.copy()
-            progress_rect.width *= self.progress / self.total
-            pe.draw.rect(pe.colors.black, progress_rect, 0)
+            self.progress_rect.width = self.line_rect.width * self.progress * self.inverse_total
+            pe.draw.rect(pe.colors.black, self.progress_rect, 0)
         elif not self.just_installed:
             pe.button.rect(
                 self.cancel_button_rect,
@@ -120,7 +134,7 @@ class Installer(pe.ChildContext, LogoMixin):
     def install_thread(self):
         self.installing = True
 
-        for root, dirs, files in (os.walk(self.from_directory) if not self.config.debug else ()):
+        for root, dirs, files in (self.walk_cache if not self.config.debug else ()):
             rel_path = os.path.relpath(root, self.from_directory)
             dest_path = os.path.join(self.to_directory, rel_path)
             os.makedirs(dest_path, exist_ok=True)
@@ -131,13 +145,21 @@ class Installer(pe.ChildContext, LogoMixin):
 
                 print(f"COPY FROM: {src_file}\nTO: {dst_file}\n")
                 try:
-                    shutil.copy2(src_file, dst_file)
+                    # copy keeps the permission bits so moss.bin stays executable, only the rest of copystat is skipped
+                    shutil.copy(src_file, dst_file)
                 except shutil.SameFileError:
                     pass
                 self.progress += 1
-        self.make_shortcut()
-        self.add_to_path()
-        self.add_to_start()
+        self.walk_cache = None
+
+        # These are independent of each other, the shortcuts can be made while PATH is updated
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            for future in [
+                executor.submit(self.make_shortcut),
+                executor.submit(self.add_to_path),
+                executor.submit(self.add_to_start)
+            ]:
+                future.result()
         print()
         self.copy_config()
 
@@ -151,8 +173,7 @@ class Installer(pe.ChildContext, LogoMixin):
 
     def make_shortcut(self):
         if os.name == 'nt':
-            desktop = winshell.desktop()
-            path = os.path.join(desktop, f"{APP_NAME}.lnk")
+            path = os.path.join(get_desktop_path(), f"{APP_NAME}.lnk")
             self.make_link(path)
         elif os.name == 'posix':
             path = "/usr/share/applications"
@@ -188,18 +209,21 @@ class Installer(pe.ChildContext, LogoMixin):
 
     def make_link(self, path):
         print(f"Making a shortcut to moss: {path}")
-        with winshell.shortcut(path) as link:
-            link.path = os.path.join(INSTALL_DIR, "moss.exe")
-            link.icon_location = (os.path.join(INSTALL_DIR, "assets", "icons", "moss.ico"), 0)
-            link.description = APP_NAME
-            link.working_directory = INSTALL_DIR
+        # Shortcuts are made through COM, which needs to be initialized on each thread using it
+        pythoncom.CoInitialize()
+        try:
+            with winshell.shortcut(path) as link:
+                link.path = os.path.join(INSTALL_DIR, "moss.exe")
+                link.icon_location = (os.path.join(INSTALL_DIR, "assets", "icons", "moss.ico"), 0)
+                link.description = APP_NAME
+                link.working_directory = INSTALL_DIR
+        finally:
+            pythoncom.CoUninitialize()
 
     def add_to_start(self):
         if os.name == 'nt':
-            import winshell
-            start = winshell.start_menu()
             # Also make a folder for it
-            path = os.path.join(start, APP_NAME)
+            path = os.path.join(get_start_menu_path(), APP_NAME)
             os.makedirs(path, exist_ok=True)
             path = os.path.join(path, f"{APP_NAME}.lnk")
             self.make_link(path)
@@ -222,7 +246,10 @@ class Installer(pe.ChildContext, LogoMixin):
                 pass
 
     def install(self):
-        self.total = sum([len(files) for _, _, files in os.walk(self.from_directory)])
+        # Walk the tree once, the install thread copies from the same listing
+        self.walk_cache = list(os.walk(self.from_directory))
+        self.total = sum(len(files) for _, _, files in self.walk_cache)
+        self.inverse_total = 1 / max(self.total, 1)
         threading.Thread(target=self.install_thread, daemon=False).start()
 
     def launch(self):
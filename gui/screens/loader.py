@@ -1,6 +1,9 @@
 import os
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from queue import Queue, Empty
 from traceback import print_exc
 
 import pygameextra as pe
@@ -114,38 +117,82 @@ class Loader(pe.ChildContext, LogoMixin):
         self.files_to_load: Union[int, None] = None
         self.last_progress = 0
         self.current_progress = 0
+        self.progress_total = 0
+        self.progress_total_inverse = 0
+        self.progress_smoothing = 1 / (self.FPS * .1)
         self.initialized = False
+        # Loaded items waiting to be finalized on the main thread
+        self.loaded_queue = Queue()
 
     def start_syncing(self):
         threading.Thread(target=self.get_documents, daemon=True).start()
 
+    def _load_one(self, key, item):
+        if isinstance(item, ResizedIcon):
+            self.load_image(key, item.item, item.scale)
+        elif not isinstance(item, str):
+            return
+        elif item.endswith('.svg'):
+            # SVGs are 40px, but we use 1000px height, so they are 23px
+            # 23 / 40 = 0.575
+            # but, I find 0.5 to better match
+            self.load_image(key, item, 0.5)
+        elif item.endswith('.png'):
+            self.load_image(key, item)
+
+        else:
+            self.load_data(key, item)
+
     def _load(self):
+        items = [(key, item) for key, item in self.TO_LOAD.items() if not isinstance(item, ReusedIcon)]
+        # Decoding and scaling happen in C with the GIL released, so use every core
+        with ThreadPoolExecutor(max_workers=min(os.cpu_count() or 1, len(items))) as executor:
+            # Consume the results so that any exception is raised here
+            for _ in executor.map(lambda key_item: self._load_one(*key_item), items):
+                pass
+
+        # Reused icons are queued last, so the icons they copy are always finalized before them
         for key, item in self.TO_LOAD.items():
             if isinstance(item, ReusedIcon):
-                self.icons[key] = self.icons[item.key].copy()
-                self.icons[key].resize(tuple(v * item.scale for v in self.icons[key].size))
-            elif isinstance(item, ResizedIcon):
-                self.load_image(key, item.item, item.scale)
-            elif not isinstance(item, str):
-                continue
-            elif item.endswith('.svg'):
-                # SVGs are 40px, but we use 1000px height, so they are 23px
-                # 23 / 40 = 0.575
-                # but, I find 0.5 to better match
-                self.load_image(key, item, 0.5)
-            elif item.endswith('.png'):
-                self.load_image(key, item)
+                self.loaded_queue.put((key, item))
 
-            else:
-                self.load_data(key, item)
-            self.items_loaded += 1
+    def warm_fonts(self):
+        # Opening fonts goes through pygameextra's font cache, so the main menu won't stall on it later
+        # Only opening happens here, rendering has to stay on the main thread
+        for font, size in (
+                (Defaults.MAIN_MENU_FONT, self.ratios.main_menu_my_files_size),
+                (Defaults.MAIN_MENU_BAR_FONT, self.ratios.main_menu_bar_size),
+                (Defaults.PATH_FONT, self.ratios.main_menu_path_size),
+                (Defaults.DEBUG_FONT, self.ratios.small_debug_text_size),
+                (Defaults.FOLDER_TITLE_FONT, self.ratios.document_tree_view_folder_title_size),
+                (Defaults.DOCUMENT_TITLE_FONT, self.ratios.document_tree_view_document_title_size),
+                (Defaults.DOCUMENT_TITLE_FONT, self.ratios.document_tree_view_small_info_size),
+        ):
+            pe.text.get_font(font, size)
 
     def load(self):
         try:
             self._load()
+            self.warm_fonts()
         except:
             print_exc()
 
+    def finalize_loaded(self):
+        # pe.Image wrapping and reused icon copies happen on the main thread
+        while True:
+            try:
+                key, item = self.loaded_queue.get_nowait()
+            except Empty:
+                return
+            if isinstance(item, ReusedIcon):
+                self.icons[key] = self.icons[item.key].copy()
+                self.icons[key].resize(tuple(v * item.scale for v in self.icons[key].size))
+            elif isinstance(item, bytes):
+                self.data[key] = item
+            else:
+                self.icons[key] = pe.Image(item.convert_alpha())
+            self.items_loaded += 1
+
     def get_documents(self):
         def progress(loaded, to_load):
             self.files_loaded = loaded
@@ -165,43 +212,61 @@ class Loader(pe.ChildContext, LogoMixin):
         self.loading_complete_marker = time.time()
 
     def load_image(self, key, file, multiplier: float = 1):
-        self.icons[key] = pe.Image(file)
-        self.icons[key].resize(tuple(self.ratios.pixel(v * multiplier) for v in self.icons[key].size))
+        # Rasterized icons are kept on disk per source file and scale, so later startups skip the SVG rendering
+        cache_key = blake2b(
+            f"{file}:{os.path.getmtime(file)}:{multiplier}:{self.ratios.scale}".encode(), digest_size=8
+        ).hexdigest()
+        cache_path = os.path.join(Defaults.CACHE_DIR, f'{cache_key}.png')
+        if os.path.exists(cache_path):
+            self.loaded_queue.put((key, pe.pygame.image.load(cache_path)))
+            return
+        surface = pe.pygame.image.load(file)
+        surface = pe.pygame.transform.scale(
+            surface, tuple(self.ratios.pixel(v * multiplier) for v in surface.get_size())
+        )
+        try:
+            partial_path = os.path.join(Defaults.CACHE_DIR, f'{cache_key}.part.png')
+            pe.pygame.image.save(surface, partial_path)
+            os.replace(partial_path, cache_path)
+        except:
+            print_exc()
+        self.loaded_queue.put((key, surface))
 
     def load_data(self, key, file):
         with open(file, 'rb') as f:
-            self.data[key] = f.read()
+            self.loaded_queue.put((key, f.read()))
 
     def progress(self):
         if self.files_to_load is None and self.config.wait_for_everything_to_load and not self.current_progress:
             # Before we know the file count, just return 0 progress
             return 0
-        try:
-            if not self.files_to_load or not self.config.wait_for_everything_to_load:
-                self.current_progress = self.items_loaded / len(self.TO_LOAD)
-            else:
-                self.current_progress = (
-                                                self.items_loaded +
-                                                self.files_loaded
-                                        ) / (
-                                                len(self.TO_LOAD) +
-                                                self.files_to_load
-                                        )
-        except ZeroDivisionError:
-            self.current_progress = 0
-        self.last_progress = self.last_progress + (self.current_progress - self.last_progress) / (self.FPS * .1)
+        if not self.files_to_load or not self.config.wait_for_everything_to_load:
+            loaded = self.items_loaded
+            total = len(self.TO_LOAD)
+        else:
+            loaded = self.items_loaded + self.files_loaded
+            total = len(self.TO_LOAD) + self.files_to_load
+        # The total only changes when the file count is known, so keep its reciprocal around
+        if total != self.progress_total:
+            self.progress_total = total
+            self.progress_total_inverse = 1 / total if total else 0
+        if total and loaded >= total:
+            # Avoid rounding errors, post_loop waits for progress to be exactly 1
+            self.current_progress = 1
+        else:
+            self.current_progress = loaded * self.progress_total_inverse
+        self.last_progress = self.last_progress + (self.current_progress - self.last_progress) * self.progress_smoothing
         if self.last_progress > .98:
             self.last_progress = 1
         return self.last_progress
 
     def loop(self):
-        self.logo.display()
+        self.finalize_loaded()
         progress = self.progress()
+        self.display_logo(line=bool(progress))
         if progress:
-            pe.draw.rect(pe.colors.black, self.line_rect, 1)
-            progress_rect = self.line_rect.copy()
-            progress_rect.width *= progress
-            pe.draw.rect(pe.colors.black, progress_rect, 0)
+            self.progress_rect.width = self.line_rect.width * progress
+            pe.draw.rect(pe.colors.black, self.progress_rect, 0)
 
     def post_loop(self):
         if self.current_progress == 1 and self.last_progress == 1:
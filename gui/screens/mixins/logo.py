@@ -1,4 +1,4 @@
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Dict, Tuple
 
 import pygameextra as pe
 
@@ -13,7 +13,9 @@ if TYPE_CHECKING:
 class LogoMixin:
     logo: pe.Text
     line_rect: pe.Rect
+    progress_rect: pe.Rect
     big_line_rect: pe.Rect
+    logo_surfaces: Dict[bool, Tuple[pe.Surface, Tuple[int, int]]]
     ratios: 'Ratios'
     width: int
     height: int
@@ -40,8 +42,22 @@ class LogoMixin:
                                  self.ratios.loader_loading_bar_height)
         self.line_rect.midtop = self.logo.rect.midbottom
         self.line_rect.top += self.ratios.loader_loading_bar_padding
+        # Reused every frame by screens drawing progress, only the width changes
+        self.progress_rect = self.line_rect.copy()
 
         self.big_line_rect = pe.Rect(0, 0, self.ratios.loader_loading_bar_big_width,
                                      self.ratios.loader_loading_bar_big_height)
         self.big_line_rect.midtop = self.logo.rect.midbottom
         self.big_line_rect.top += self.ratios.loader_loading_bar_padding
+        self.logo_surfaces = {}
+
+    def display_logo(self, line: bool = False):
+        # The logo and the empty loading bar only change on resize, so they are drawn once and blitted after that
+        if (cached := self.logo_surfaces.get(line)) is None:
+            area = self.logo.rect.union(self.line_rect) if line else self.logo.rect.copy()
+            surface = pe.Surface(area.size)
+            surface.stamp(self.logo.obj, self.logo.rect.move(-area.left, -area.top))
+            if line:
+                pe.draw.rect(pe.colors.black, self.line_rect.move(-area.left, -area.top), 1, display_work=surface)
+            cached = self.logo_surfaces[line] = (surface, area.topleft)
+        pe.display.blit(*cached)
@@ -2,16 +2,15 @@ import base64
 from functools import lru_cache
 import os
 import pygameextra as pe
-
-# noinspection PyBroadException
-try:
-    from CEF4pygame import CEFpygame
-except Exception:
-    CEFpygame = None
+from typing import TYPE_CHECKING
 
 from gui.defaults import Defaults
+from gui.gui import get_cefpygame
 from ..shared_model import AbstractRenderer
 
+if TYPE_CHECKING:
+    from CEF4pygame import CEFpygame
+
 
 # noinspection PyPep8Naming
 class PDF_CEF_Viewer(AbstractRenderer):
@@ -19,7 +18,7 @@ class PDF_CEF_Viewer(AbstractRenderer):
 
     def __init__(self, document_renderer):
         super().__init__(document_renderer)
-        self.pdf: CEFpygame = None
+        self.pdf: 'CEFpygame' = None
         self.injected_js = False
         self.js_code = None
         self.url_should_be = None
@@ -38,6 +37,9 @@ class PDF_CEF_Viewer(AbstractRenderer):
         if not self.pdf_raw:
             return
         url = f'{os.path.abspath(self.PDF_HTML)}'
+        if (CEFpygame := get_cefpygame()) is None:
+            self.error = 'CEF not available, try restarting the application'
+            return
         try:
             self.pdf = CEFpygame(
                 URL=url,
@@ -10,16 +10,7 @@ from gui.screens.viewer.renderers.pdf.cef import PDF_CEF_Viewer
 from .renderers.notebook.rm_lines import Notebook_rM_Lines_Renderer
 from .renderers.pdf.pymupdf import PDF_PyMuPDF_Viewer
 from ...events import ResizeEvent
-
-try:
-    import CEF4pygame
-
-    CEF4pygame.print = lambda *args, **kwargs: None
-    from CEF4pygame import CEFpygame
-    from cefpython3 import cefpython as cef
-except Exception:
-    CEFpygame = None
-    cef = None
+from ...gui import get_cefpygame
 
 from gui.defaults import Defaults
 from gui.pp_helpers import DraggablePuller
@@ -161,7 +152,7 @@ class DocumentRenderer(pe.ChildContext):
 
     def load(self):
         if self.document.content.file_type in ('pdf', 'epub'):
-            if self.config.pdf_render_mode == 'cef' and CEFpygame:
+            if self.config.pdf_render_mode == 'cef' and get_cefpygame():
                 self.loading += 1
                 self.renderer = PDF_CEF_Viewer(self)
             elif self.config.pdf_render_mode == 'pymupdf':
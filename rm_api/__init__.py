@@ -10,6 +10,7 @@ from typing import Dict, List, Union
 
 import requests
 import colorama
+from crc32c import hardware_based
 from requests.adapters import HTTPAdapter
 from urllib3 import Retry
 
@@ -23,10 +24,14 @@ from rm_api.storage.old_sync import get_documents_old_sync, update_root, RootUpl
 from rm_api.storage.new_sync import get_root as get_root_new
 from rm_api.storage.old_sync import get_root as get_root_old
 from rm_api.storage.v3 import get_documents_using_root, get_file, get_file_contents, make_files_request, put_file, \
-    check_file_exists
+    check_file_exists, check_files_exist, remove_stale_partial_files, file_writer, FILES_PATH
 
 colorama.init()
 
+# Documents, previews and uploads all share the session from many threads, keep enough connections alive for them
+HTTP_POOL_CONNECTIONS = 8
+HTTP_POOL_SIZE = 32
+
 
 class API:
     document_collections: Dict[str, DocumentCollection]
@@ -37,9 +42,13 @@ class API:
         self.retry_strategy = Retry(
             total=10,
             backoff_factor=2,
-            status_forcelist=(429, 503)
+            status_forcelist=(429, 502, 503, 504)
+        )
+        http_adapter = HTTPAdapter(
+            pool_connections=HTTP_POOL_CONNECTIONS,
+            pool_maxsize=HTTP_POOL_SIZE,
+            max_retries=self.retry_strategy
         )
-        http_adapter = HTTPAdapter(max_retries=self.retry_strategy)
         self.session = requests.Session()
         self.session.mount("http://", http_adapter)
         self.session.mount("https://", http_adapter)
@@ -55,11 +64,17 @@ class API:
         self.sync_file_path = sync_file_path
         if self.sync_file_path is not None:
             os.makedirs(self.sync_file_path, exist_ok=True)
+            file_writer.submit(remove_stale_partial_files, self.sync_file_path)
         self.last_root = None
         self.offline_mode = False
         self.document_storage_uri = None
         self.document_notifications_uri = None
         self._upload_lock = threading.Lock()
+        self._background_loop = None
+        self._background_loop_lock = threading.Lock()
+        # Created on the background loop when first needed
+        self.aiohttp_session = None
+        self.httpx_client = None
         self.sync_notifiers: int = 0
         self._hook_list = {}  # Used for event hooks
         self._use_new_sync = False
@@ -93,6 +108,49 @@ class API:
                             format='%(asctime)s - %(message)s',
                             filemode='a')  # 'a' for append mode
         self.loop = asyncio.get_event_loop()
+        if not hardware_based:
+            self.log("Warning, crc32c is not hardware accelerated, upload checksums will be slower")
+
+    @property
+    def document_storage_uri(self):
+        return self._document_storage_uri
+
+    @document_storage_uri.setter
+    def document_storage_uri(self, value):
+        self._document_storage_uri = value
+        # File requests just append the hash to this
+        self.files_url_prefix = f'{value}{FILES_PATH}' if value else None
+
+    @property
+    def background_loop(self) -> asyncio.AbstractEventLoop:
+        # One long lived loop for uploads and document scans, started when first needed
+        with self._background_loop_lock:
+            if self._background_loop is None:
+                self._background_loop = asyncio.new_event_loop()
+                threading.Thread(target=self._background_loop.run_forever, daemon=True).start()
+        return self._background_loop
+
+    def close(self):
+        # Close the shared clients on the background loop they were made on, then stop the loop
+        with self._background_loop_lock:
+            loop, self._background_loop = self._background_loop, None
+        if loop is None:
+            return
+
+        async def close_clients():
+            if self.aiohttp_session is not None and not self.aiohttp_session.closed:
+                await self.aiohttp_session.close()
+            if self.httpx_client is not None and not self.httpx_client.is_closed:
+                await self.httpx_client.aclose()
+
+        try:
+            asyncio.run_coroutine_threadsafe(close_clients(), loop).result(timeout=5)
+        except Exception:
+            print_exc()
+        finally:
+            self.aiohttp_session = None
+            self.httpx_client = None
+            loop.call_soon_threadsafe(loop.stop)
 
     @property
     def use_new_sync(self):
@@ -270,18 +328,19 @@ class API:
 
         # Figure out what files have changed
         progress.total += sum(len(document.files) for document in documents)
+        try:
+            existing = check_files_exist(
+                self, [file.hash for document in documents for file in document.files], use_cache=False)
+        except:
+            print_exc()
+            existing = {}
         for document in documents:
             for file in document.files:
-                try:
-                    exists = check_file_exists(self, file.hash, binary=True, use_cache=False)
-                    if not exists:
-                        files_with_changes.append(file)
-                    else:
-                        old_files.append(file)
-                except:
+                if existing.get(file.hash):
+                    old_files.append(file)
+                else:
                     files_with_changes.append(file)
-                finally:
-                    progress.done += 1
+                progress.done += 1
 
         # Copy the content data so we can add more files to it
         content_datas = {}
@@ -45,6 +45,9 @@ def try_to_load_int(rm_value: str):
 
 
 class File:
+    # Trees and the root index hold thousands of these
+    __slots__ = ('hash', 'uuid', 'content_count', 'size', 'rm_filename')
+
     def __init__(self, file_hash: str, file_uuid: str, content_count: str, file_size: Union[str, int],
                  rm_filename=None):
         self.hash = file_hash
@@ -61,6 +64,22 @@ class File:
         file_hash, _, file_uuid, content_count, file_size = line.split(':')
         return cls(file_hash, file_uuid, content_count, file_size)
 
+    @classmethod
+    def from_lines(cls, lines: List[str]) -> List['File']:
+        files = []
+        append = files.append
+        new = cls.__new__
+        # Same as from_line, but the fields are known to be strings, so __init__ and its checks are skipped
+        for line in lines:
+            file_hash, _, file_uuid, content_count, file_size = line.split(':')
+            file = new(cls)
+            file.hash = file_hash
+            file.uuid = file.rm_filename = file_uuid
+            file.content_count = int(content_count)
+            file.size = int(file_size)
+            append(file)
+        return files
+
     def to_root_line(self):
         return f'{self.hash}:80000000:{self.uuid}:{self.content_count}:{self.size}\n'
 
@@ -467,6 +486,20 @@ class Content:
 
 
 class Metadata:
+    __slots__ = (
+        '__metadata', 'hash', 'type', 'parent', 'pinned', 'created_time', 'last_modified', 'visible_name',
+        'metadata_modified', 'modified', 'synced', 'version', 'last_opened', 'last_opened_page'
+    )
+    # Attribute name -> metadata key and how to store the value there
+    METADATA_KEYS = {
+        'created_time': ('createdTime', str),
+        'last_modified': ('lastModified', str),
+        'visible_name': ('visibleName', None),
+        'metadata_modified': ('metadatamodified', None),
+        'last_opened': ('lastOpened', str),
+        'last_opened_page': ('lastOpenedPage', None),
+    }
+
     def __init__(self, metadata: dict, metadata_hash: str):
         self.__metadata = metadata
         self.hash = metadata_hash
@@ -508,22 +541,11 @@ class Metadata:
     def __setattr__(self, key, value):
         super().__setattr__(key, value)
 
-        # A dirty translation of the keys to metadata keys
-        if key == 'created_time':
-            key = 'createdTime'
-            value = str(value)
-        if key == 'last_modified':
-            key = 'lastModified'
-            value = str(value)
-        if key == 'visible_name':
-            key = 'visibleName'
-        if key == 'metadata_modified':
-            key = 'metadatamodified'
-        if key == 'last_opened':
-            key = 'lastOpened'
-            value = str(value)
-        if key == 'last_opened_page':
-            key = 'lastOpenedPage'
+        # Translate the attribute to its metadata key
+        if (translation := self.METADATA_KEYS.get(key)) is not None:
+            key, convert = translation
+            if convert is not None:
+                value = convert(value)
 
         if key not in self.__metadata:
             return
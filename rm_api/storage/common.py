@@ -8,6 +8,8 @@ from crc32c import crc32c
 DOCUMENT_STORAGE_URL = "{0}service/json/1/document-storage?environment=production&group=auth0%7C5a68dc51cb30df3877a1d7c4&apiVer=2"
 DOCUMENT_NOTIFICATIONS_URL = "{0}service/json/1/notifications?environment=production&group=auth0%7C5a68dc51cb30df3877a1d7c4&apiVer=1"
 
+HASH_CHUNK_SIZE = 1024 * 1024
+
 if TYPE_CHECKING:
     from rm_api import API, FileSyncProgress, DocumentSyncProgress
 
@@ -83,12 +85,13 @@ class FileHandle:
         hasher = sha256()
         self.checksum = 0
         self.open()
-        while True:
-            data = self.file_handle.read(4096)
-            if not data:
-                break
-            hasher.update(data)
-            self.checksum = crc32c(data, self.checksum)
+        self.reset()
+        # Read into one reused buffer, both hashers accept the memoryview without copying
+        buffer = bytearray(HASH_CHUNK_SIZE)
+        view = memoryview(buffer)
+        while size := self.file_handle.readinto(buffer):
+            hasher.update(view[:size])
+            self.checksum = crc32c(view[:size], self.checksum)
         self._hash = hasher.hexdigest()
         return self._hash
 
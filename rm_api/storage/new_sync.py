@@ -1,3 +1,4 @@
+from functools import lru_cache
 from typing import TYPE_CHECKING
 import jwt
 
@@ -22,7 +23,12 @@ def get_documents_new_sync(api: 'API', progress):
     return get_documents_using_root(api, progress, root)
 
 
+@lru_cache(maxsize=8)
+def get_tectonic(token: str) -> str:
+    token_info = jwt.decode(token, algorithms=["HS256"], options={"verify_signature": False})
+    return token_info['tectonic']
+
+
 def handle_new_api_steps(api: 'API'):
-    token_info = jwt.decode(api.token, algorithms=["HS256"], options={"verify_signature": False})
-    tectonic = token_info['tectonic']
+    tectonic = get_tectonic(api.token)
     api.document_notifications_uri = api.document_storage_uri = f'https://{tectonic}.tectonic.remarkable.com/'
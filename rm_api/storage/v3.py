@@ -1,48 +1,184 @@
 import asyncio
 import base64
 import json
+import marshal
 import os
+import tempfile
+import threading
+import time
 from hashlib import sha256
-from traceback import format_exc
+from traceback import format_exc, format_exception
 
 import aiohttp
+import httpx
 from aiohttp import ClientTimeout
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from colorama import Fore, Style
 from crc32c import crc32c
-from functools import lru_cache
 from json import JSONDecodeError
 
 from urllib3 import Retry
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 import rm_api.models as models
-from typing import TYPE_CHECKING, Union, Tuple, List
+from typing import TYPE_CHECKING, Union, Tuple, List, Dict, BinaryIO
 
 from rm_api.notifications.models import DocumentSyncProgress, FileSyncProgress
 from rm_api.storage.common import FileHandle, ProgressFileAdapter
 from rm_api.storage.exceptions import NewSyncRequired
 
-FILES_URL = "{0}sync/v3/files/{1}"
+FILES_PATH = "sync/v3/files/"
+INVALID_HASH_RESPONSE = b'{"message":"invalid hash"}\n'
+SCAN_CONCURRENCY = 32
+HEAD_CONCURRENCY = 32
+MAX_CACHE = 2048
+MAX_CACHED_SIZE = 1024 * 1024  # Anything bigger is only kept on disk
+MAX_BLOB_CACHE_SIZE = 64 * 1024 * 1024  # Total size of the raw files kept in memory
+STREAM_CHUNK_SIZE = 64 * 1024
+PROGRESS_RATE = 60
+PARSED_CACHE_SUFFIX = '.marshal'
+PARTIAL_FILE_SUFFIX = '.part'
+STALE_PARTIAL_FILE_AGE = 60 * 60  # Partial files older than this were left behind by a crash
 
 if TYPE_CHECKING:
     from rm_api import API
     from rm_api.models import File
 
 DEFAULT_ENCODING = 'utf-8'
-EXTENSION_ORDER = ['content', 'metadata', 'rm']
 
+# Cache files are written in the background, the interpreter waits for pending writes when exiting
+file_writer = ThreadPoolExecutor(max_workers=2)
+
+# mkstemp creates files only the owner can read, cache files get the usual permissions instead
+umask = os.umask(0)
+os.umask(umask)
+CACHE_FILE_MODE = 0o666 & ~umask
+
+# Files are content addressed, so the caches only need to be keyed by the file hash and the request.
+# Parsed JSON and existence checks are bounded by count, raw files by their total size
+file_cache: 'OrderedDict[tuple, Union[dict, list, bool]]' = OrderedDict()
+blob_cache: 'OrderedDict[tuple, Union[str, bytes]]' = OrderedDict()
+blob_cache_size = 0
+blob_cache_lock = threading.Lock()
+
+
+def cache_get(key: tuple):
+    for cache in (file_cache, blob_cache):
+        try:
+            cache.move_to_end(key)
+            return cache[key]
+        except KeyError:
+            continue
+    return None
+
+
+def cache_put(key: tuple, value):
+    global blob_cache_size
+    if value is None:
+        return
+    if isinstance(value, (bytes, str)):
+        if len(value) > MAX_CACHED_SIZE:
+            return
+        with blob_cache_lock:
+            if (previous := blob_cache.pop(key, None)) is not None:
+                blob_cache_size -= len(previous)
+            blob_cache[key] = value
+            blob_cache_size += len(value)
+            while blob_cache_size > MAX_BLOB_CACHE_SIZE:
+                blob_cache_size -= len(blob_cache.popitem(last=False)[1])
+        return
+    file_cache[key] = value
+    file_cache.move_to_end(key)
+    if len(file_cache) > MAX_CACHE:
+        file_cache.popitem(last=False)
+
+
+def open_partial_file(location: str) -> Tuple[BinaryIO, str]:
+    # A unique file next to the cache file, even other processes sharing the sync folder won't write into it
+    fd, partial_location = tempfile.mkstemp(
+        prefix=f'{os.path.basename(location)}.', suffix=PARTIAL_FILE_SUFFIX, dir=os.path.dirname(location)
+    )
+    if hasattr(os, 'fchmod'):
+        os.fchmod(fd, CACHE_FILE_MODE)
+    return os.fdopen(fd, 'wb'), partial_location
+
+
+def remove_stale_partial_files(sync_file_path: str):
+    # Recent partial files might still be written by another instance sharing the sync folder
+    stale_time = time.time() - STALE_PARTIAL_FILE_AGE
+    with os.scandir(sync_file_path) as entries:
+        for entry in entries:
+            if not entry.name.endswith(PARTIAL_FILE_SUFFIX):
+                continue
+            try:
+                if entry.stat().st_mtime < stale_time:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def write_file(location: str, data: bytes):
+    f, partial_location = open_partial_file(location)
+    try:
+        with f:
+            f.write(data)
+        os.replace(partial_location, location)
+    except:
+        os.remove(partial_location)
+        raise
+
+
+def submit_cache_write(api: 'API', location: str, data: bytes):
+    def report_failure(future):
+        if (exception := future.exception()) is not None:
+            api.log(f"Caching {location} failed\n"
+                    f"{''.join(format_exception(type(exception), exception, exception.__traceback__))}")
+
+    file_writer.submit(write_file, location, data).add_done_callback(report_failure)
 
-def get_file_item_order(item: 'File'):
+
+def read_cached_file(location: str) -> Union[bytes, None]:
+    # Opening straight away saves checking if the file exists first
+    try:
+        with open(location, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def read_parsed_cache(location: str):
+    # Parsed JSON is marshalled next to the cached file, loading that skips parsing the JSON again.
+    # Unlike pickle, loading marshal data can't run code planted in a shared sync folder
     try:
-        return EXTENSION_ORDER.index(item.uuid.rsplit('.', 1)[-1])
-    except ValueError:
-        return -1
+        with open(f'{location}{PARSED_CACHE_SUFFIX}', 'rb') as f:
+            return marshal.load(f)
+    except Exception:
+        # Missing or corrupt, either way the JSON gets parsed again and the sidecar rewritten
+        return None
+
+
+def write_parsed_cache(api: 'API', location: str, parsed):
+    # Serialized before returning, the caller is free to modify the parsed object afterwards
+    submit_cache_write(api, f'{location}{PARSED_CACHE_SUFFIX}', marshal.dumps(parsed))
+
+
+def json_loads(data: bytes):
+    # orjson parses the bytes directly, without decoding them first
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 def make_storage_request(api: 'API', method, request, data: dict = None) -> Union[str, None, dict]:
     response = api.session.request(
         method,
         request.format(api.document_storage_uri),
-        json=data or {},
+        json=data or None,
     )
 
     if response.status_code == 400:
@@ -52,15 +188,27 @@ def make_storage_request(api: 'API', method, request, data: dict = None) -> Unio
         print(response.text, response.status_code)
         return None
     try:
-        return response.json()
+        return json_loads(response.content)
     except JSONDecodeError:
-        return response.text
+        return response.content.decode(DEFAULT_ENCODING)
 
 
-@lru_cache
 def make_files_request(api: 'API', method, file, data: dict = None, binary: bool = False, use_cache: bool = True,
                        enforce_cache: bool = False) -> \
         Union[str, None, dict, bool, bytes]:
+    if method == 'GET' and not data:
+        key = (file, method, binary)
+        if use_cache and (cached := cache_get(key)) is not None:
+            return cached
+        result = make_files_request_uncached(api, method, file, data, binary, use_cache, enforce_cache)
+        cache_put(key, result)
+        return result
+    return make_files_request_uncached(api, method, file, data, binary, use_cache, enforce_cache)
+
+
+def make_files_request_uncached(api: 'API', method, file, data: dict = None, binary: bool = False,
+                                use_cache: bool = True, enforce_cache: bool = False) -> \
+        Union[str, None, dict, bool, bytes]:
     if method == 'HEAD':
         method = 'GET'
         head = True
@@ -70,48 +218,69 @@ def make_files_request(api: 'API', method, file, data: dict = None, binary: bool
         location = os.path.join(api.sync_file_path, file)
     else:
         location = None
-    if use_cache and location and os.path.exists(location):
+    if use_cache and location:
         if head:
-            return True
-        if binary:
-            with open(location, 'rb') as f:
-                return f.read()
-        else:
-            with open(location, 'r', encoding=DEFAULT_ENCODING) as f:
-                data = f.read()
+            if os.path.exists(location):
+                return True
+        elif binary:
+            if (cached := read_cached_file(location)) is not None:
+                return cached
+        elif (parsed := read_parsed_cache(location)) is not None:
+            return parsed
+        elif (cached := read_cached_file(location)) is not None:
             try:
-                return json.loads(data)
+                parsed = json_loads(cached)
             except JSONDecodeError:
-                return data
+                return cached.decode(DEFAULT_ENCODING)
+            write_parsed_cache(api, location, parsed)
+            return parsed
     if enforce_cache:
         # Checked cache and it wasn't there
         return None
+    # Binary files can be large, so they get written to disk as they download
+    stream_to_disk = binary and not head and location is not None
     response = api.session.request(
         method,
-        FILES_URL.format(api.document_storage_uri, file),
+        api.files_url_prefix + file,
         json=data or None,
-        stream=head,
+        stream=head or stream_to_disk,
         allow_redirects=not head
     )
     if head and response.status_code in (302, 404, 200):
         return response.status_code != 404
-    if response.content == b'{"message":"invalid hash"}\n':
+    if stream_to_disk and response.ok:
+        # Download next to the cache file first, so an interrupted download never ends up in the cache
+        f, partial_location = open_partial_file(location)
+        try:
+            with f:
+                for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                    f.write(chunk)
+            with open(partial_location, 'rb') as f:
+                content = f.read()
+            if content != INVALID_HASH_RESPONSE:
+                os.replace(partial_location, location)
+                return content
+        except:
+            os.remove(partial_location)
+            raise
+        os.remove(partial_location)
+        return None
+    if response.content == INVALID_HASH_RESPONSE:
         return None
     elif not response.ok:
         raise Exception(f"Failed to make files request - {response.status_code}\n{response.text}")
+    if location:
+        submit_cache_write(api, location, response.content)
     if binary:
-        if location:
-            with open(location, "wb") as f:
-                f.write(response.content)
         return response.content
     else:
-        if location:
-            with open(location, "w", encoding=DEFAULT_ENCODING) as f:
-                f.write(response.text)
         try:
-            return response.json()
+            parsed = json_loads(response.content)
         except JSONDecodeError:
-            return response.text
+            return response.content.decode(DEFAULT_ENCODING)
+        if location:
+            write_parsed_cache(api, location, parsed)
+        return parsed
 
 
 async def fetch_with_retries(session: aiohttp.ClientSession, url: str, method: str, retry_strategy: Retry,
@@ -129,6 +298,7 @@ async def fetch_with_retries(session: aiohttp.ClientSession, url: str, method: s
                     data=data_adapter,
                     **kwargs
             ) as response:
+                # Reading the body releases the connection back to the pool, even when retrying
                 await response.read()
                 if response.status in retry_statuses:
                     raise aiohttp.ClientResponseError(
@@ -137,8 +307,6 @@ async def fetch_with_retries(session: aiohttp.ClientSession, url: str, method: s
                         status=response.status,
                         message=f"HTTP error with status code {response.status}"
                     )
-                else:
-                    await response.read()
             return response
         except (aiohttp.ClientResponseError, asyncio.TimeoutError) as e:
             attempt += 1
@@ -150,6 +318,16 @@ async def fetch_with_retries(session: aiohttp.ClientSession, url: str, method: s
                 raise e
 
 
+def get_aiohttp_session(api: 'API') -> aiohttp.ClientSession:
+    # Shared by every upload and existence check on the background loop, so connections are reused between them
+    if api.aiohttp_session is None or api.aiohttp_session.closed:
+        api.aiohttp_session = aiohttp.ClientSession(
+            timeout=ClientTimeout(total=3600),  # One hour timeout limit
+            connector=aiohttp.TCPConnector(limit=HEAD_CONCURRENCY, limit_per_host=HEAD_CONCURRENCY)
+        )
+    return api.aiohttp_session
+
+
 async def put_file_async(api: 'API', file: 'File', data: bytes, sync_event: DocumentSyncProgress):
     if isinstance(data, FileHandle):
         crc_result = data.crc32c()
@@ -165,53 +343,52 @@ async def put_file_async(api: 'API', file: 'File', data: bytes, sync_event: Docu
     sync_event.add_task()
 
     data_adapter = ProgressFileAdapter(sync_event, upload_progress, data)
-    timeout = ClientTimeout(total=3600)  # One hour timeout limit
     google = False
+    session = get_aiohttp_session(api)
+
+    # Try uploading through remarkable
+    try:
+        response = await fetch_with_retries(
+            session,
+            api.files_url_prefix + file.hash,
+            'PUT',
+            api.retry_strategy,
+            data_adapter,
+            headers=(headers := {
+                **api.session.headers,
+                'content-length': str(content_length),
+                'content-type': 'application/octet-stream',
+                'rm-filename': file.rm_filename,
+                'x-goog-hash': f'crc32c={checksum_bs4}'
+            }),
+            allow_redirects=False
+        )
+    except:
+        api.log(format_exc())
+        return False
+
+    if response.status == 302:
+        google = True
+        # Reset progress, start uploading through google instead
+        data_adapter.reset()
 
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        # Try uploading through remarkable
         try:
+            api.log("Google signed url was provided by the API, uploading to that now.")
             response = await fetch_with_retries(
                 session,
-                FILES_URL.format(api.document_storage_uri, file.hash),
+                response.headers['location'],
                 'PUT',
                 api.retry_strategy,
                 data_adapter,
-                headers=(headers := {
-                    **api.session.headers,
-                    'content-length': str(content_length),
-                    'content-type': 'application/octet-stream',
-                    'rm-filename': file.rm_filename,
+                headers={
+                    **headers,
+                    'x-goog-content-length-range': response.headers['x-goog-content-length-range'],
                     'x-goog-hash': f'crc32c={checksum_bs4}'
-                }),
-                allow_redirects=False
+                }
             )
         except:
             api.log(format_exc())
             return False
-
-        if response.status == 302:
-            google = True
-            # Reset progress, start uploading through google instead
-            data_adapter.reset()
-
-            try:
-                api.log("Google signed url was provided by the API, uploading to that now.")
-                response = await fetch_with_retries(
-                    session,
-                    response.headers['location'],
-                    'PUT',
-                    api.retry_strategy,
-                    data_adapter,
-                    headers={
-                        **headers,
-                        'x-goog-content-length-range': response.headers['x-goog-content-length-range'],
-                        'x-goog-hash': f'crc32c={checksum_bs4}'
-                    }
-                )
-            except:
-                api.log(format_exc())
-                return False
     if response.status == 400:
         if '<Code>ExpiredToken</Code>' in await response.text():
             data_adapter.reset()
@@ -232,36 +409,208 @@ async def put_file_async(api: 'API', file: 'File', data: bytes, sync_event: Docu
 
 def put_file(api: 'API', file: 'File', data: bytes, sync_event: DocumentSyncProgress):
     api.spread_event(sync_event)
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        loop.run_until_complete(put_file_async(api, file, data, sync_event))
-    finally:
-        loop.close()
+    return asyncio.run_coroutine_threadsafe(put_file_async(api, file, data, sync_event), api.background_loop).result()
 
 
 def get_file(api: 'API', file, use_cache: bool = True, raw: bool = False) -> Tuple[int, Union[List['File'], List[str]]]:
-    res = make_files_request(api, "GET", file, use_cache=use_cache)
+    # Manifests are never JSON, so they are read as bytes and split here instead of going through the JSON probe
+    res = make_files_request(api, "GET", file, binary=True, use_cache=use_cache)
     if not res:
         return -1, []
-    if isinstance(res, int):
-        return res, []
-    version, *lines = res.splitlines()
+    version, _, rest = res.decode(DEFAULT_ENCODING).partition('\n')
+    version = version.rstrip('\r')
+    lines = rest.splitlines()
     if raw:
         return version, lines
-    return version, [models.File.from_line(line) for line in lines]
+    return version, models.File.from_lines(lines)
 
 
 def get_file_contents(api: 'API', file, binary: bool = False, use_cache: bool = True, enforce_cache: bool = False):
     return make_files_request(api, "GET", file, binary=binary, use_cache=use_cache, enforce_cache=enforce_cache)
 
 
-@lru_cache(maxsize=600)
 def check_file_exists(api: 'API', file, binary: bool = False, use_cache: bool = True):
-    return make_files_request(api, "HEAD", file, binary=binary, use_cache=use_cache)
+    key = (file,)
+    if use_cache and cache_get(key):
+        return True
+    exists = make_files_request(api, "HEAD", file, binary=binary, use_cache=use_cache)
+    if exists:
+        # Only existence is cached, a missing file might still get uploaded
+        cache_put(key, True)
+    return exists
+
+
+async def bulk_head(api: 'API', hashes: List[str]) -> Dict[str, bool]:
+    semaphore = asyncio.Semaphore(HEAD_CONCURRENCY)
+    session = get_aiohttp_session(api)
+    headers = dict(api.session.headers)
+
+    async def head(file_hash: str):
+        async with semaphore:
+            try:
+                # Same as make_files_request, a GET without following the redirect or reading the body
+                async with session.get(
+                        api.files_url_prefix + file_hash,
+                        headers=headers,
+                        allow_redirects=False
+                ) as response:
+                    return file_hash, response.status in (200, 302)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                api.log(f"Checking {file_hash} failed\n{format_exc()}")
+                return file_hash, False
+
+    return dict(await asyncio.gather(*(head(file_hash) for file_hash in hashes)))
+
+
+def check_files_exist(api: 'API', hashes: List[str], use_cache: bool = True) -> Dict[str, bool]:
+    results = {}
+    if use_cache:
+        results.update({file_hash: True for file_hash in hashes if cache_get((file_hash,))})
+    if missing := [file_hash for file_hash in dict.fromkeys(hashes) if file_hash not in results]:
+        results.update(asyncio.run_coroutine_threadsafe(bulk_head(api, missing), api.background_loop).result())
+    for file_hash, exists in results.items():
+        if exists:
+            # Prepopulate check_file_exists
+            cache_put((file_hash,), True)
+    return results
+
+
+async def make_files_request_async(api: 'API', client: httpx.AsyncClient, file, read_cached: bool = True) -> \
+        Union[bytes, None]:
+    # The async counterpart of a GET through make_files_request, it shares the same sync cache
+    if api.sync_file_path:
+        location = os.path.join(api.sync_file_path, file)
+    else:
+        location = None
+    if location and not read_cached:
+        if os.path.exists(location):
+            return None
+    elif location:
+        # Cache reads run on the default executor, so they overlap with each other and with the downloads
+        cached = await asyncio.get_running_loop().run_in_executor(None, read_cached_file, location)
+        if cached is not None:
+            return cached
+    # The headers are passed every time, the token can be refreshed while the client is alive
+    response = await client.get(api.files_url_prefix + file, headers=dict(api.session.headers))
+    if response.status_code != 200 or response.content == INVALID_HASH_RESPONSE:
+        return None
+    if location:
+        # Wait for the write, the regular requests that follow expect the file to be cached
+        await asyncio.get_running_loop().run_in_executor(file_writer, write_file, location, response.content)
+    return response.content
+
+
+def get_httpx_client(api: 'API') -> httpx.AsyncClient:
+    # Lives on the background loop and is kept between scans, so its connections stay warm.
+    # Redirects are followed, the same as the requests session does for a GET
+    if api.httpx_client is not None and not api.httpx_client.is_closed:
+        return api.httpx_client
+    try:
+        # HTTP/2 multiplexes all the small file requests over a few connections
+        api.httpx_client = httpx.AsyncClient(
+            http2=True,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=4)
+        )
+    except ImportError:
+        # The h2 package is missing, fall back to HTTP/1.1 with a connection per concurrent request
+        api.httpx_client = httpx.AsyncClient(
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=SCAN_CONCURRENCY, max_keepalive_connections=SCAN_CONCURRENCY)
+        )
+    return api.httpx_client
+
+
+class ThrottledProgress:
+    """Forwards progress updates at most PROGRESS_RATE times a second, the last update always gets through"""
+
+    def __init__(self, progress):
+        self.progress = progress
+        self.pending = None
+        self.last_update = 0
+
+    def __call__(self, done, total):
+        self.pending = (done, total)
+        if done >= total or time.monotonic() - self.last_update >= 1 / PROGRESS_RATE:
+            self.flush()
+
+    def flush(self):
+        if self.pending is None:
+            return
+        self.progress(*self.pending)
+        self.pending = None
+        self.last_update = time.monotonic()
+
+
+class DocumentTreePrefetcher:
+    """Fetches the document trees into the sync cache concurrently, ahead of get_documents_using_root"""
+
+    def __init__(self, api: 'API', files: List['File']):
+        self.api = api
+        self.files = files
+        self.futures = {}
+        self.loop = None
+        self.client: httpx.AsyncClient = None
+        self.semaphore: asyncio.BoundedSemaphore = None
+
+    def __enter__(self):
+        # Without a sync cache there is nowhere to prefetch to
+        if not self.api.sync_file_path or self.api.offline_mode:
+            return self
+        self.loop = self.api.background_loop
+        asyncio.run_coroutine_threadsafe(self.open(), self.loop).result()
+        for file in self.files:
+            self.futures[file.hash] = asyncio.run_coroutine_threadsafe(self.prefetch_document(file), self.loop)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self.loop:
+            return
+        for future in self.futures.values():
+            future.cancel()
+
+    async def open(self):
+        self.client = get_httpx_client(self.api)
+        self.semaphore = asyncio.BoundedSemaphore(SCAN_CONCURRENCY)
+
+    def wait(self, file: 'File'):
+        if (future := self.futures.get(file.hash)) is None:
+            return
+        try:
+            future.result()
+        except:
+            # The regular requests will retry and handle whatever went wrong
+            self.api.log(f"Prefetching {file.uuid} failed\n{format_exc()}")
+
+    async def prefetch_document(self, file: 'File'):
+        # The document keeps its slot for the content and metadata too,
+        # so those don't queue up behind the manifests of every other document
+        async with self.semaphore:
+            data = await make_files_request_async(self.api, self.client, file.hash)
+            if not data:
+                return
+            _, *lines = data.decode(DEFAULT_ENCODING).splitlines()
+            items = models.File.from_lines(lines)
+            # The scan reads the content and metadata itself, they only need to end up in the cache
+            await asyncio.gather(*(
+                make_files_request_async(self.api, self.client, item.hash, read_cached=False)
+                for item in items
+                if item.uuid.endswith('.content') or item.uuid.endswith('.metadata')
+            ))
+
+
+def get_tree_hash(file: 'File', file_content: List['File']) -> str:
+    # The tree is content addressed, so its hash never changes for the same file hash
+    key = (file.hash, 'TREE')
+    if (expected_hash := cache_get(key)) is None:
+        expected_hash = sha256(bytes.fromhex(''.join(item.hash for item in file_content))).hexdigest()
+        if file_content:
+            cache_put(key, expected_hash)
+    return expected_hash
 
 
 def get_documents_using_root(api: 'API', progress, root):
+    progress = ThrottledProgress(progress)
     try:
         _, files = get_file(api, root)
     except:
@@ -282,94 +631,106 @@ def get_documents_using_root(api: 'API', progress, root):
         put_file(api, root_file, root_file_content, DocumentSyncProgress(''))
         update_root(api, new_root)
         _, files = get_file(api, new_root['hash'])
-    deleted_document_collections_list = set(api.document_collections.keys())
-    deleted_documents_list = set(api.documents.keys())
+    seen_document_collections = set()
+    seen_documents = set()
     document_collections_with_items = set()
     badly_hashed = []
 
     total = len(files)
 
-    for i, file in enumerate(files):
-        _, file_content = get_file(api, file.hash)
-        content = None
-
-        # Check the hash in case it needs fixing
-        document_file_hash = sha256()
-        for item in sorted(file_content, key=lambda item: file.uuid):
-            document_file_hash.update(bytes.fromhex(item.hash))
-        expected_hash = document_file_hash.hexdigest()
-        matches_hash = file.hash == expected_hash
-
-        file_content.sort(key=get_file_item_order)
-        for item in file_content:
-            if item.uuid == f'{file.uuid}.content':
-                try:
-                    content = get_file_contents(api, item.hash)
-                except:
-                    break
-                if not isinstance(content, dict):
-                    break
-            if item.uuid == f'{file.uuid}.metadata':
-                if (old_document_collection := api.document_collections.get(file.uuid)) is not None:
-                    if api.document_collections[file.uuid].metadata.hash == item.hash:
-                        if file.uuid in deleted_document_collections_list:
-                            deleted_document_collections_list.remove(file.uuid)
-                        if old_document_collection.uuid not in document_collections_with_items:
-                            old_document_collection.has_items = False
-                        if (parent_document_collection := api.document_collections.get(
-                                old_document_collection.parent)) is not None:
-                            parent_document_collection.has_items = True
-                            document_collections_with_items.add(old_document_collection.parent)
+    # Bound once, the loop below goes through these for every file
+    document_collections = api.document_collections
+    documents = api.documents
+    # Only what was known before the scan can be deleted, uploads can add items while it runs
+    initial_document_collections = set(document_collections)
+    initial_documents = set(documents)
+
+    with DocumentTreePrefetcher(api, files) as prefetcher:
+        for i, file in enumerate(files):
+            prefetcher.wait(file)
+            _, file_content = get_file(api, file.hash)
+            content = None
+
+            # Check the hash in case it needs fixing
+            matches_hash = file.hash == get_tree_hash(file, file_content)
+
+            # Only the content and metadata are needed here, look them up once and handle the content first
+            content_uuid = f'{file.uuid}.content'
+            metadata_uuid = f'{file.uuid}.metadata'
+            items = {item.uuid: item for item in file_content}
+            for item in filter(None, (items.get(content_uuid), items.get(metadata_uuid))):
+                if item.uuid == content_uuid:
+                    try:
+                        content = get_file_contents(api, item.hash)
+                    except:
+                        break
+                    if not isinstance(content, dict):
+                        break
+                if item.uuid == metadata_uuid:
+                    if (old_document_collection := document_collections.get(file.uuid)) is not None:
+                        if old_document_collection.metadata.hash == item.hash:
+                            seen_document_collections.add(file.uuid)
+                            if old_document_collection.uuid not in document_collections_with_items:
+                                old_document_collection.has_items = False
+                            if (parent_document_collection := document_collections.get(
+                                    old_document_collection.parent)) is not None:
+                                parent_document_collection.has_items = True
+                                document_collections_with_items.add(old_document_collection.parent)
+                            continue
+                    elif (old_document := documents.get(file.uuid)) is not None:
+                        if old_document.metadata.hash == item.hash:
+                            seen_documents.add(file.uuid)
+                            if (parent_document_collection := document_collections.get(
+                                    old_document.parent)) is not None:
+                                parent_document_collection.has_items = True
+                            document_collections_with_items.add(old_document.parent)
+                            continue
+                    try:
+                        metadata = models.Metadata(get_file_contents(api, item.hash), item.hash)
+                    except:
                         continue
-                elif (old_document := api.documents.get(file.uuid)) is not None:
-                    if api.documents[file.uuid].metadata.hash == item.hash:
-                        if file.uuid in deleted_documents_list:
-                            deleted_documents_list.remove(file.uuid)
-                        if (parent_document_collection := api.document_collections.get(
-                                old_document.parent)) is not None:
+                    if metadata.type == 'CollectionType':
+                        if content is not None:
+                            tags = content.get('tags', ())
+                        else:
+                            tags = ()
+                        document_collection = document_collections[file.uuid] = models.DocumentCollection(
+                            [models.Tag(tag) for tag in tags],
+                            metadata, file.uuid
+                        )
+
+                        if file.uuid in document_collections_with_items:
+                            document_collection.has_items = True
+
+                        if (parent_document_collection := document_collections.get(
+                                document_collection.parent)) is not None:
                             parent_document_collection.has_items = True
-                        document_collections_with_items.add(old_document.parent)
-                        continue
-                try:
-                    metadata = models.Metadata(get_file_contents(api, item.hash), item.hash)
-                except:
-                    continue
-                if metadata.type == 'CollectionType':
-                    if content is not None:
-                        tags = content.get('tags', ())
-                    else:
-                        tags = ()
-                    api.document_collections[file.uuid] = models.DocumentCollection(
-                        [models.Tag(tag) for tag in tags],
-                        metadata, file.uuid
-                    )
+                        document_collections_with_items.add(document_collection.parent)
+
+                        seen_document_collections.add(file.uuid)
+                        break
+                    elif metadata.type == 'DocumentType':
+                        document = documents[file.uuid] = models.Document(
+                            api, models.Content(content, item.hash, api.debug), metadata, file_content, file.uuid
+                        )
+                        if not matches_hash:
+                            badly_hashed.append(document)
+                        if (parent_document_collection := document_collections.get(document.parent)) is not None:
+                            parent_document_collection.has_items = True
+                        document_collections_with_items.add(document.parent)
+                        seen_documents.add(file.uuid)
+                        break
+            progress(i + 1, total)
+        else:
+            i = 0
 
-                    if file.uuid in document_collections_with_items:
-                        api.document_collections[file.uuid].has_items = True
-
-                    if (parent_document_collection := api.document_collections.get(
-                            api.document_collections[file.uuid].parent)) is not None:
-                        parent_document_collection.has_items = True
-                    document_collections_with_items.add(api.document_collections[file.uuid].parent)
-
-                    if file.uuid in deleted_document_collections_list:
-                        deleted_document_collections_list.remove(file.uuid)
-                    break
-                elif metadata.type == 'DocumentType':
-                    api.documents[file.uuid] = models.Document(api, models.Content(content, item.hash, api.debug),
-                                                               metadata, file_content, file.uuid)
-                    if not matches_hash:
-                        badly_hashed.append(api.documents[file.uuid])
-                    if (parent_document_collection := api.document_collections.get(
-                            api.documents[file.uuid].parent)) is not None:
-                        parent_document_collection.has_items = True
-                    document_collections_with_items.add(api.documents[file.uuid].parent)
-                    if file.uuid in deleted_documents_list:
-                        deleted_documents_list.remove(file.uuid)
-                    break
-        progress(i + 1, total)
-    else:
-        i = 0
+    # Anything that wasn't in the tree got deleted, except what is still being uploaded
+    deleted_document_collections_list = [
+        uuid for uuid in initial_document_collections - seen_document_collections
+        if (document_collection := api.document_collections.get(uuid)) is not None
+        and not getattr(document_collection, 'provision', False)
+    ]
+    deleted_documents_list = (initial_documents - seen_documents) & api.documents.keys()
 
     if badly_hashed:
         print(f"{Fore.YELLOW}Warning, fixing some bad document tree hashes!{Fore.RESET}")
@@ -390,3 +751,4 @@ def get_documents_using_root(api: 'API', progress, root):
         except KeyError:
             pass
         progress(i + j + k + 1, total)
+    progress.flush()